@@ -22,9 +22,9 @@
 # Web      :  https://www.lauszus.com
 # e-mail   :  lauszus@gmail.com
 
-import logging
+import sys
 
-from pyblhost import BlhostSerial
+from pyblhost import BlhostSerial, create_logger
 
 
 def main() -> None:
@@ -32,20 +32,16 @@ def main() -> None:
     port, baudrate = "/dev/ttyUSB0", 500000
 
     # Create a logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(stream_handler)
+    logger = create_logger()
 
     with BlhostSerial(port, baudrate, logger) as blhost:
         for i in range(3):  # Try 3 times
             if blhost.ping(timeout=1):  # Wait 1 second for a response
-                logger.info("Reset responded in {} attempt(s)".format(i + 1))
-                exit(0)
+                logger.info("Ping responded in %d attempt(s)", i + 1)
+                sys.exit(0)
 
-        logger.error("Timed out waiting for reset response")
-        exit(1)
+        logger.error("Timed out waiting for ping response")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
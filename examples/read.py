@@ -22,9 +22,10 @@
 # Web      :  https://www.lauszus.com
 # e-mail   :  lauszus@gmail.com
 
-import logging
+import os
+import sys
 
-from pyblhost import BlhostCan
+from pyblhost import BlhostCan, create_logger
 
 
 def main() -> None:
@@ -32,35 +33,40 @@ def main() -> None:
     tx_id, rx_id = 0x123, 0x321
 
     # Create a logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(stream_handler)
+    logger = create_logger()
 
     # Specify the binary write to, the start address to read from and the byte count to read
     binary = "memory.bin"
     start_address, byte_count = 0x0C000, 0x34000
 
-    with BlhostCan(tx_id, rx_id, logger) as blhost:
-        old_progress = None
-        data = None
-        for progress in blhost.read(start_address, byte_count, timeout=1):
-            if not isinstance(progress, bytearray):
-                # The progress is returned as a float, so round the value in order to not spam the console
-                progress = round(progress)
-                if progress != old_progress:
-                    old_progress = progress
-                    logger.info("Read memory progress: {} %".format(progress))
-            else:
-                data = progress
-        if data is None:
-            logger.error("Reading memory failed")
-            exit(1)
-        with open(binary, "wb") as f:
-            f.write(data)
-        logger.info("Reading memory succeeded")
-        exit(0)
+    # The data is written directly to a temporary file as it is received, so it is not kept in memory.
+    # The file is only renamed when all the data has been read, so a failed read does not leave a partial file behind
+    temp_binary = binary + ".part"
+    result = False
+    try:
+        with BlhostCan(tx_id, rx_id, logger) as blhost, open(temp_binary, "wb") as f:
+            old_progress = None
+            for progress in blhost.read(start_address, byte_count, timeout=1, sink=f):
+                if isinstance(progress, float):
+                    # The progress is returned as a float, so round it down to a multiple of 5 % in order to not
+                    # spam the console
+                    progress = int(progress) // 5 * 5
+                    if progress != old_progress:
+                        old_progress = progress
+                        logger.info("Read memory progress: %d %%", progress)
+                else:
+                    # True will be returned when all the data has been written to the file
+                    result = progress is True
+    finally:
+        if result is not True and os.path.exists(temp_binary):
+            os.remove(temp_binary)
+
+    if result is not True:
+        logger.error("Reading memory failed")
+        sys.exit(1)
+    os.replace(temp_binary, binary)
+    logger.info("Reading memory succeeded")
+    sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -22,9 +22,9 @@
 # Web      :  https://www.lauszus.com
 # e-mail   :  lauszus@gmail.com
 
-import logging
+import sys
 
-from pyblhost import BlhostCan
+from pyblhost import BlhostCan, create_logger
 
 
 def main() -> None:
@@ -32,11 +32,7 @@ def main() -> None:
     tx_id, rx_id = 0x123, 0x321
 
     # Create a logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(stream_handler)
+    logger = create_logger()
 
     # Specify the binary to upload, the start address to upload it to and the byte count to erase before uploading
     binary = "blink.bin"
@@ -47,20 +43,21 @@ def main() -> None:
         result = False
         for progress in blhost.upload(binary, start_address, byte_count, timeout=1):
             if not isinstance(progress, bool):
-                # The progress is returned as a float, so round the value in order to not spam the console
-                progress = round(progress)
+                # The progress is returned as a float, so round it down to a multiple of 5 % in order to not
+                # spam the console
+                progress = int(progress) // 5 * 5
                 if progress != old_progress:
                     old_progress = progress
-                    logger.info("Upload progress: {} %".format(progress))
+                    logger.info("Upload progress: %d %%", progress)
             else:
                 # The result will be returned as a boolean
                 result = progress
         if result is True:
             logger.info("Uploading succeeded")
-            exit(0)
+            sys.exit(0)
         else:
             logger.error("Uploading failed")
-            exit(1)
+            sys.exit(1)
 
 
 if __name__ == "__main__":
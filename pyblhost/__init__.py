@@ -24,6 +24,24 @@
 
 __version__ = "1.6.0"
 
-__all__ = ["BlhostCan", "BlhostSerial"]
+__all__ = ["BlhostCan", "BlhostSerial", "create_logger"]
 
-from .pyblhost import BlhostCan, BlhostSerial
+import importlib
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .pyblhost import BlhostCan, BlhostSerial, create_logger
+
+
+def __getattr__(name: str) -> Any:
+    # The implementation is only imported when it is used, as it imports both python-can and pyserial
+    if name == "pyblhost":
+        # Importing the submodule binds it as an attribute on this package, so this is only done the first time
+        return importlib.import_module("." + name, __name__)
+    if name in __all__:
+        from . import pyblhost
+
+        value = getattr(pyblhost, name)
+        globals()[name] = value  # Cache it, so this function is only called the first time
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
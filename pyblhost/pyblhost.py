@@ -23,13 +23,17 @@
 # e-mail   :  lauszus@gmail.com
 
 import argparse
+import binascii
 import logging
+import os
+import stat
 import struct
+import sys
 import threading
 import time
 from enum import IntEnum
 from types import TracebackType
-from typing import Any, Callable, Generator, List, Optional, Type, Union
+from typing import Any, BinaryIO, Callable, Dict, Generator, Optional, Tuple, Type, Union
 
 import can
 import serial
@@ -162,6 +166,14 @@ class BlhostBase(object):
             10607  # Cannot swap flash because provided swap indicator is invalid
         )
 
+    # The structs are created once, so the format strings are not parsed every time a packet is sent or received
+    _FRAMING_HEADER_STRUCT = struct.Struct("<BBH")  # Start byte, packet type and length
+    _COMMAND_HEADER_STRUCT = struct.Struct("<BBBB")  # Tag, flags, reserved and parameter count
+    _U16_STRUCT = struct.Struct("<H")
+    _U32_STRUCT = struct.Struct("<L")
+    _U32_U32_STRUCT = struct.Struct("<LL")
+    _PING_RESPONSE_STRUCT = struct.Struct("<BBBBH")  # Bugfix, minor, major, name and options
+
     def __init__(self, logger: logging.Logger) -> None:
         self.logger = logger
 
@@ -169,10 +181,16 @@ class BlhostBase(object):
         self._send_lock = threading.Lock()
 
         # Used to re-send the previous packet if NAK is received
-        self._last_send_packet: List[Any] = []
+        self._last_send_packet: Union[bytes, bytearray] = b""
+
+        # The last packet is only re-sent on a NAK when it is the only packet waiting for an ACK
+        self._resend_on_nak = True
+        self._nak_event = threading.Event()
+
+        # Released for every ACK received, so it counts the number of packets acknowledged by the target
+        self._ack_semaphore = threading.Semaphore(0)
 
         # Flags used when uploading
-        self._ack_response_event = threading.Event()
         self._reset_response_event = threading.Event()
         self._flash_erase_region_response_event = threading.Event()
         self._read_memory_response_tag_event = threading.Event()
@@ -182,13 +200,35 @@ class BlhostBase(object):
         self._ping_response_event = threading.Event()
         self._get_command_response_event = threading.Event()
 
+        # The property values from the last successful GetPropertyResponse
+        self._property_values: Tuple[int, ...] = ()
+
+        # Handlers for the packets received from the target. The keys are plain ints, as they are compared with the
+        # packet type and response tag taken directly from the received data
+        self._packet_handlers: Dict[int, Callable[[bytearray], None]] = {
+            _TYPE_ACK: self._on_ack,
+            _TYPE_NAK: self._on_nak,
+            _TYPE_ACK_ABORT: self._on_ack_abort,
+            _TYPE_COMMAND: self._on_command,
+            _TYPE_DATA: self._on_data,
+            _TYPE_PING_RESPONSE: self._on_ping_response,
+        }
+        self._response_handlers: Dict[int, Callable[[bytearray, int, int, str, int], None]] = {
+            int(self.ResponseTags.GenericResponse): self._on_generic_response,
+            int(self.ResponseTags.ReadMemoryResponse): self._on_read_memory_response,
+            int(self.ResponseTags.GetPropertyResponse): self._on_get_property_response,
+            # int(self.ResponseTags.FlashReadOnceResponse): self._on_flash_read_once_response,
+        }
+
         # Used to store memory data when reading
         self._memory_data = bytearray()
+        self._memory_data_offset = 0
+        self._memory_data_sink: Optional[BinaryIO] = None
 
-    def _send_implementation(self, data: List[Any]) -> None:
+    def _send_implementation(self, data: Union[bytes, bytearray]) -> None:
         raise NotImplementedError
 
-    def _send(self, data: List[Any]) -> None:
+    def _send(self, data: Union[bytes, bytearray]) -> None:
         with self._send_lock:
             self._last_send_packet = data
             self._send_implementation(data)
@@ -205,6 +245,18 @@ class BlhostBase(object):
         self._get_property(property_tag, memory_id)
         return self._get_command_response_event.wait(timeout)
 
+    def _get_max_packet_size(self, timeout: float) -> Optional[int]:
+        """Get the maximum size of the payload of a packet the target is able to receive.
+        :param timeout: The time to wait in seconds for a response.
+        :return: Returns the maximum packet size or None if the target did not report it.
+        """
+        self._property_values = ()
+        self._get_command_response_event.clear()
+        self._get_property(self.PropertyTag.MaxPacketSize)
+        if not self._get_command_response_event.wait(timeout) or len(self._property_values) != 1:
+            return None
+        return self._property_values[0]
+
     def shutdown(self, timeout: float = 1.0) -> None:
         raise NotImplementedError
 
@@ -217,8 +269,7 @@ class BlhostBase(object):
     def ping(self, timeout: float = 5.0) -> bool:
         self.logger.info("BlhostBase: Sending ping command")
         self._ping_response_event.clear()
-        data = [self.FramingPacketConstants.StartByte, self.FramingPacketConstants.Type_Ping]
-        self._send(data)
+        self._send(_PING_PACKET)
         return self._ping_response_event.wait(timeout)
 
     def reset(self, timeout: float = 5.0) -> bool:
@@ -237,27 +288,49 @@ class BlhostBase(object):
         attempts: int = 1,
         reset: bool = True,
         assume_success: bool = False,
+        ack_window: int = 1,
+        packet_size: Optional[int] = None,
     ) -> Generator[Union[float, bool], None, None]:
         if attempts < 1:
             raise ValueError('BlhostBase: "attempts" has to be greater than 0')
+        if ack_window < 1:
+            raise ValueError('BlhostBase: "ack_window" has to be greater than 0')
+        if packet_size is not None and not 1 <= packet_size <= 0xFFFF:
+            raise ValueError('BlhostBase: "packet_size" has to be in the range 1-65535')
         self.logger.info('BlhostBase: Uploading "{}" to 0x{:X}'.format(binary_filename, start_address))
 
         # Read the binary data from the file
-        with open(binary_filename, "rb") as f:
-            binary_data = f.read()
-
         # "The byte count is rounded up to a multiple of 4, and trailing bytes are filled with the
         # flash erase pattern (0xff)."
         # However this is wrong! For the MK66FX1M0xxx18 it needs to be 16-byte aligned
-        if len(binary_data) % 16 != 0:
-            binary_data += bytes([0xFF] * (16 - (len(binary_data) % 16)))
+        with open(binary_filename, "rb") as f:
+            file_stat = os.fstat(f.fileno())
+            if stat.S_ISREG(file_stat.st_mode):
+                # The buffer is allocated with the padding already filled in, so the data is not copied when padding it
+                file_size = file_stat.st_size
+                binary_data = bytearray(b"\xff") * ((file_size + 15) & ~15)
+                with memoryview(binary_data) as view:
+                    read_size = f.readinto(view[:file_size])
+                if read_size != file_size or f.read(1):
+                    raise OSError('BlhostBase: "{}" changed size while it was being read'.format(binary_filename))
+            else:
+                # The size of a pipe or a character device is not known in advance, so just read all of it
+                binary_data = bytearray(f.read())
+                binary_data += b"\xff" * (-len(binary_data) % 16)
 
         upload_result = False
         for _ in range(attempts):
             try:
                 # Yield a progress while uploading and store the return value
                 upload_result = yield from self._upload(
-                    binary_data, start_address, erase_byte_count, timeout, ping_repeat, assume_success
+                    binary_data,
+                    start_address,
+                    erase_byte_count,
+                    timeout,
+                    ping_repeat,
+                    assume_success,
+                    ack_window,
+                    packet_size,
                 )
 
                 # We need to clear the backup region if uploading fails.
@@ -289,12 +362,14 @@ class BlhostBase(object):
 
     def _upload(
         self,
-        binary_data: bytes,
+        binary_data: Union[bytes, bytearray],
         start_address: int,
         erase_byte_count: int,
         timeout: float,
         ping_repeat: int,
         assume_success: bool = False,
+        ack_window: int = 1,
+        packet_size: Optional[int] = None,
     ) -> Generator[float, None, bool]:
         # Try to ping the target 3 times to make sure we can communicate with the bootloader
         for i in range(ping_repeat):
@@ -305,6 +380,21 @@ class BlhostBase(object):
             self.logger.warning("BlhostBase: Target did not respond to ping")
             return False
 
+        if packet_size is None:
+            # Send the data in packets as large as the target supports. Fall back to 32 bytes, as all targets must be
+            # able to receive that
+            packet_size = self._get_max_packet_size(timeout)
+            if packet_size is None:
+                self.logger.info("BlhostBase: Target did not report the max packet size, using 32 bytes")
+                packet_size = 32
+            elif not 1 <= packet_size <= 0xFFFF:
+                # The length in the framing packet is only 16 bits
+                self.logger.warning(
+                    "BlhostBase: Target reported an invalid max packet size: {}, using 32 bytes".format(packet_size)
+                )
+                packet_size = 32
+        self.logger.info("BlhostBase: Sending data in packets of {} bytes".format(packet_size))
+
         # First erase the region of memory where application will be located
         # The application will be flashed when this command succeeds
         self.logger.info(
@@ -326,20 +416,42 @@ class BlhostBase(object):
         # This flag will be set when uploading has finished
         self._write_memory_response_event.clear()
 
-        # We need to send the data in chunks of 32 bytes
-        # When an ACK is received we can send the next chunk
+        # The data is sent in chunks of "packet_size" bytes
+        # Up to "ack_window" packets are sent before waiting for an ACK. By default we wait for an ACK after every
+        # packet. A larger window is faster, but requires that the target is able to buffer the packets and it is not
+        # possible to recover from a NAK, as the packet that was NAKed might not be the last one sent. In that case
+        # the upload fails instead
         yield 0.0  # The progress starts at 0 %
-        data_sent = 0
-        for d in self.chunks(binary_data, 32):
-            self._ack_response_event.clear()
-            self._data_packet(*d)
-            if not self._ack_response_event.wait(timeout):
-                self.logger.warning("BlhostBase: Timed out waiting for ACK response")
-                return False
-
-            # Yield the progress in percent
-            data_sent += len(d)
-            yield data_sent / len(binary_data) * 100.0
+        self._ack_semaphore = threading.Semaphore(0)  # Discard any ACKs received for the previous commands
+        self._nak_event.clear()
+        self._resend_on_nak = ack_window == 1
+        try:
+            packet_count = (len(binary_data) + packet_size - 1) // packet_size
+            packets_sent = packets_acked = last_progress = 0
+            for d in self.chunks(binary_data, packet_size):
+                self._data_packet(d)
+                packets_sent += 1
+
+                # Wait until there is room for the next packet. After the last packet wait for all of them to be acked
+                while packets_sent - packets_acked >= ack_window or (
+                    packets_sent == packet_count and packets_acked < packets_sent
+                ):
+                    if not self._ack_semaphore.acquire(timeout=timeout):
+                        self.logger.warning("BlhostBase: Timed out waiting for ACK response")
+                        return False
+                    if not self._resend_on_nak and self._nak_event.is_set():
+                        self.logger.error("BlhostBase: Received NAK while several packets were waiting for an ACK")
+                        return False
+                    packets_acked += 1
+
+                    # Only yield the progress in percent when it changes by a whole percent, so the caller is not
+                    # resumed for every single packet
+                    progress = packets_acked / packet_count * 100.0
+                    if int(progress) != last_progress:
+                        last_progress = int(progress)
+                        yield progress
+        finally:
+            self._resend_on_nak = True
 
         if self._write_memory_response_event.wait(timeout):
             # "The target returns a GenericResponse packet with a status code set to
@@ -351,77 +463,87 @@ class BlhostBase(object):
         return assume_success
 
     def _ack(self) -> None:
-        data = [self.FramingPacketConstants.StartByte, self.FramingPacketConstants.Type_Ack]
-        self._send(data)
+        self._send(_ACK_PACKET)
 
     @staticmethod
-    def chunks(lst: Union[list, bytes], n: int) -> Generator[Union[list, bytes], None, None]:
-        for i in range(0, len(lst), n):
-            yield lst[i : i + n]
+    def chunks(lst: Union[bytes, bytearray, memoryview], n: int) -> Generator[memoryview, None, None]:
+        # Slicing a memoryview does not copy the data
+        view = memoryview(lst)
+        for i in range(0, len(view), n):
+            yield view[i : i + n]
 
     @staticmethod
-    def crc16_xmodem(data: Union[bytes, list], crc_init: int = 0) -> int:
+    def crc16_xmodem(data: Union[bytes, bytearray, memoryview, list], crc_init: int = 0) -> int:
         """
         Calculate XMODEM 16-bit CRC from input data
         :param data: Input data
         :param crc_init: Initialization value
         """
-        crc = crc_init
-        for c in data:
-            crc ^= c << 8
-            for _ in range(8):
-                temp = crc << 1
-                if crc & 0x8000:
-                    temp ^= 0x1021
-                crc = temp
-        return crc & 0xFFFF
-
-    def _framing_packet(self, packet_type: FramingPacketConstants, length: int, *payload: Any) -> None:
-        # The CRC16 value is calculated on all the data
-        crc16 = self.crc16_xmodem(
-            [self.FramingPacketConstants.StartByte, packet_type, length & 0xFF, (length >> 8) & 0xFF, *payload]
-        )
+        # binascii.crc_hqx() implements the XMODEM CRC in C, so it is much faster than calculating it in Python
+        return binascii.crc_hqx(bytes(data) if isinstance(data, list) else data, crc_init & 0xFFFF)
 
-        # Construct the frame header
-        data = [
-            self.FramingPacketConstants.StartByte,
-            packet_type,
-            length & 0xFF,
-            (length >> 8) & 0xFF,
-            crc16 & 0xFF,
-            (crc16 >> 8) & 0xFF,
-        ]
+    def _framing_packet(self, packet_type: int, payload: Union[bytes, memoryview]) -> None:
+        # The packet is written directly into a single buffer, so no intermediate objects are created
+        packet = bytearray(6 + len(payload))
 
-        # Append the payload
-        data.extend(payload)
+        # Construct the frame header i.e. start byte (uint8_t), packet type (uint8_t) and length (uint16_t)
+        self._FRAMING_HEADER_STRUCT.pack_into(packet, 0, _START_BYTE, packet_type, len(payload))
+        packet[6:] = payload
+
+        # The CRC16 value is calculated on the header and the payload and is stored after the header
+        with memoryview(packet) as view:
+            crc16 = self.crc16_xmodem(view[6:], self.crc16_xmodem(view[:4]))
+        self._U16_STRUCT.pack_into(packet, 4, crc16)
 
         # Send the data to the target
-        self._send(data)
+        self._send(packet)
 
-    def _command_packet(self, tag: CommandTags, flags: int, *payload: Any) -> None:
+    def _command_packet(self, tag: CommandTags, flags: int, payload: bytes = b"") -> None:
         """Used for sending commands to the target"""
         self._framing_packet(
-            self.FramingPacketConstants.Type_Command, 4 + len(payload), tag, flags, 0, len(payload), *payload
+            _TYPE_COMMAND,
+            self._COMMAND_HEADER_STRUCT.pack(tag, flags, 0, len(payload)) + payload,
         )
 
-    def _data_packet(self, *payload: Any) -> None:
+    def _data_packet(self, payload: Union[bytes, memoryview]) -> None:
         """Used for sending data to the target"""
-        self._framing_packet(self.FramingPacketConstants.Type_Data, len(payload), *payload)
+        self._framing_packet(_TYPE_DATA, payload)
 
     def _get_property(self, property_tag: PropertyTag, memory_id: int = 0) -> None:
         # Memory ID: 0 = Internal flash, 0x01 = QSPI0 memory
-        self._command_packet(
-            self.CommandTags.GetProperty, 0x00, *[x for x in struct.Struct("<LL").pack(property_tag, memory_id)]
-        )
+        self._command_packet(self.CommandTags.GetProperty, 0x00, self._U32_U32_STRUCT.pack(property_tag, memory_id))
 
     def _flash_erase_region(self, start_address: int, byte_count: int) -> None:
         self._command_packet(
-            self.CommandTags.FlashEraseRegion, 0x00, *[x for x in struct.Struct("<LL").pack(start_address, byte_count)]
+            self.CommandTags.FlashEraseRegion, 0x00, self._U32_U32_STRUCT.pack(start_address, byte_count)
         )
 
     def read(
-        self, start_address: int, byte_count: int, timeout: float = 5.0, ping_repeat: int = 3
-    ) -> Generator[Union[float, bytearray], None, None]:
+        self,
+        start_address: int,
+        byte_count: int,
+        timeout: float = 5.0,
+        ping_repeat: int = 3,
+        sink: Optional[BinaryIO] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Generator[Union[float, bytearray, bool], None, None]:
+        """Read memory from the target.
+        :param start_address: The address to read memory from.
+        :param byte_count: The number of bytes to read.
+        :param timeout: The time to wait in seconds for a response.
+        :param ping_repeat: The number of times to try to ping the target.
+        :param sink: Optional binary file object the data is written to as it is received.
+        :param chunk_size: Optional maximum number of bytes to request per read memory command.
+                           By default all the data is requested using a single command.
+        :return: Yields the progress in percent followed by the read data if it succeeded.
+                 The data is yielded as a bytearray without copying it; use bytes() if an immutable copy is needed.
+                 If a sink is given the data is not kept in memory and True is yielded instead.
+        """
+        if byte_count < 1:
+            raise ValueError('BlhostBase: "byte_count" has to be greater than 0')
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError('BlhostBase: "chunk_size" has to be greater than 0')
+
         # Try to ping the target 3 times to make sure we can communicate with the bootloader
         for i in range(ping_repeat):
             if self.ping(timeout=timeout):
@@ -431,200 +553,272 @@ class BlhostBase(object):
             self.logger.warning("BlhostBase: Target did not respond to ping")
             return
 
-        # Clear any data that was read before
-        self._memory_data.clear()
-
-        # Make sure the flags are cleared
-        self._data_event.clear()
-        self._read_memory_response_tag_event.clear()
+        # Preallocate the buffer, so the incoming data can be written directly into it
+        self._memory_data = bytearray(byte_count if sink is None else 0)
+        self._memory_data_offset = 0
+        self._memory_data_sink = sink
+        try:
+            yield from self._read(start_address, byte_count, timeout, byte_count if chunk_size is None else chunk_size)
+        finally:
+            # Make sure no data is written to the sink after we are done reading
+            self._memory_data_sink = None
+
+    def _read(
+        self, start_address: int, byte_count: int, timeout: float, chunk_size: int
+    ) -> Generator[Union[float, bytearray, bool], None, None]:
+        last_progress = -1
+        for offset in range(0, byte_count, chunk_size):
+            chunk_byte_count = min(chunk_size, byte_count - offset)
+
+            # Make sure the flags are cleared
+            self._data_event.clear()
+            self._read_memory_response_tag_event.clear()
 
-        # Send the read memory command
-        self._read_memory_response_event.clear()
-        self._read_memory(start_address, byte_count)
-        if not self._read_memory_response_event.wait(timeout):
-            self.logger.error("BlhostBase: Timed out waiting for read memory response")
-            return
+            # Send the read memory command
+            self._read_memory_response_event.clear()
+            self._read_memory(start_address + offset, chunk_byte_count)
+            if not self._read_memory_response_event.wait(timeout):
+                self.logger.error("BlhostBase: Timed out waiting for read memory response")
+                return
 
-        while True:
-            yield len(self._memory_data) / byte_count * 100.0
-            if not self._data_event.wait(timeout):
+            while True:
+                # Only yield the progress when it changes by a whole percent, as the data is already stored by the
+                # data callback and there is no reason to resume the caller for every single data packet
+                progress = self._memory_data_offset / byte_count * 100.0
+                if int(progress) != last_progress:
+                    last_progress = int(progress)
+                    yield progress
+                if not self._data_event.wait(timeout):
+                    self.logger.error("BlhostBase: Timed out waiting for read memory data event")
+                    return
+                self._data_event.clear()
                 if self._read_memory_response_tag_event.is_set():
-                    # We are done reading all the data
-                    yield 100.0
+                    # We are done reading all the data for this command
                     break
-                self.logger.error("BlhostBase: Timed out waiting for read memory data event")
-                return
-            self._data_event.clear()
 
-        if len(self._memory_data) != byte_count:
-            self.logger.error(
-                "BlhostBase: Memory data does not have the correct length: {} != {}".format(
-                    len(self._memory_data), byte_count
+            if self._memory_data_offset != offset + chunk_byte_count:
+                self.logger.error(
+                    "BlhostBase: Memory data does not have the correct length: {} != {}".format(
+                        self._memory_data_offset, offset + chunk_byte_count
+                    )
                 )
-            )
-            return
+                return
 
-        yield self._memory_data
+        # The last data packet and the response might be handled before the progress is checked again, so make sure
+        # the progress always ends at 100 %
+        if last_progress != 100:
+            yield 100.0
+
+        if self._memory_data_sink is not None:
+            yield True
+        else:
+            yield self._memory_data
 
     def _read_memory(self, start_address: int, byte_count: int) -> None:
-        self._command_packet(
-            self.CommandTags.ReadMemory, 0x00, *[x for x in struct.Struct("<LL").pack(start_address, byte_count)]
-        )
+        self._command_packet(self.CommandTags.ReadMemory, 0x00, self._U32_U32_STRUCT.pack(start_address, byte_count))
 
-    def _write_memory(self, start_address: int, data: bytes) -> None:
-        self._command_packet(
-            self.CommandTags.WriteMemory, 0x00, *[x for x in struct.Struct("<LL").pack(start_address, len(data))]
-        )
+    def _write_memory(self, start_address: int, data: Union[bytes, bytearray]) -> None:
+        self._command_packet(self.CommandTags.WriteMemory, 0x00, self._U32_U32_STRUCT.pack(start_address, len(data)))
 
     def _reliable_update(self, address: int = 0) -> None:
         """
         Can be used to make the target perform "reliable update operation".
         Note it will also do this during reset
         """
-        self._command_packet(self.CommandTags.ReliableUpdate, 0x00, *[x for x in struct.Struct("<L").pack(address)])
+        self._command_packet(self.CommandTags.ReliableUpdate, 0x00, self._U32_STRUCT.pack(address))
 
     # This will be called by the listener i.e. in a different thread!
     def _data_callback(self, data: bytearray) -> None:
-        if data[0] != self.FramingPacketConstants.StartByte:
+        if data[0] != _START_BYTE:
             self.logger.error("BlhostBase: Invalid start byte: {}".format(data))
             return
 
         # We never parse the CRC16, as that has already been done when parsing the data
-        if data[1] == self.FramingPacketConstants.Type_Ack:
-            # The previous packet was received successfully; the sending of more packets is allowed
-            self.logger.debug("BlhostBase: Received ACK")
-            self._ack_response_event.set()
-        elif data[1] == self.FramingPacketConstants.Type_Nak:
-            # The previous packet was corrupted and must be re-sent
-            self.logger.warning("BlhostBase: Received NAK")
-            if len(self._last_send_packet) > 0:
-                self.logger.info("BlhostBase: Resending last packet")
-                self._send(self._last_send_packet)
-        elif data[1] == self.FramingPacketConstants.Type_AckAbort:
-            # Data phase is being aborted
-            self.logger.error("BlhostBase: Received ACK abort")
-        elif data[1] == self.FramingPacketConstants.Type_Command:
-            # Acknowledge that we received the response
-            self._ack()
-
-            # length, crc16 = struct.Struct('<HH').unpack(data[2:6])
-            tag, flags, _, parameter_count = struct.Struct("<BBBB").unpack(data[6:10])  # Parse the header
-
-            # Parse the status code and convert the status code into a user friendly name if possible
-            status_code = struct.Struct("<L").unpack(data[10:14])[0]
-            try:
-                status_name = self.StatusCodes(status_code).name
-            except ValueError:
-                status_name = str(status_code)
-
-            # Set the log level based on the status code
-            level = logging.INFO if status_code == self.StatusCodes.Success else logging.WARNING
-
-            if tag == self.ResponseTags.GenericResponse:
-                command_tag = struct.Struct("<L").unpack(data[14:])[0]
-                # log the parameter value in a generic way
-                # to print KBOOT getProperty responses
-                self.logger.log(
-                    level,
-                    "BlhostBase: ResponseTags.GenericResponse: status: {}, parameter: {}".format(
-                        status_name, command_tag
-                    ),
-                )
-
-                # Check which command tag the response was for
-                if command_tag == self.CommandTags.Reset:
-                    self.logger.log(level, "BlhostBase: CommandTag.Reset status: {}".format(status_name))
-                    if status_code == self.StatusCodes.Success:
-                        self._reset_response_event.set()
-                elif command_tag == self.CommandTags.FlashEraseRegion:
-                    self.logger.log(level, "BlhostBase: CommandTag.FlashEraseRegion status: {}".format(status_name))
-                    if status_code == self.StatusCodes.Success:
-                        self._flash_erase_region_response_event.set()
-                elif command_tag == self.CommandTags.ReadMemory:
-                    self.logger.log(level, "BlhostBase: CommandTag.ReadMemory status: {}".format(status_name))
-                    if status_code == self.StatusCodes.Success:
-                        self._read_memory_response_tag_event.set()
-                elif command_tag == self.CommandTags.WriteMemory:
-                    self.logger.log(level, "BlhostBase: CommandTag.WriteMemory status: {}".format(status_name))
-                    if status_code == self.StatusCodes.Success:
-                        self._write_memory_response_event.set()
-                elif command_tag == self.CommandTags.ReliableUpdate:
-                    if status_code == self.StatusCodes.ReliableUpdateSuccess:
-                        level = logging.INFO  # Change the logging level, as this is also a successfully message
-                    self.logger.log(level, "BlhostBase: CommandTag.ReliableUpdate status: {}".format(status_name))
-                else:
-                    self.logger.log(
-                        level,
-                        "BlhostBase: ResponseTags.GenericResponse: status: {}, command tag: {:02X}".format(
-                            status_name, command_tag
-                        ),
-                    )
-            elif tag == self.ResponseTags.ReadMemoryResponse:
-                data_byte_count = struct.Struct("<L".format()).unpack(data[14:])[0]
-                self.logger.log(
-                    level,
-                    "BlhostBase: ResponseTags.ReadMemoryResponse: status: {}, data byte count: {}".format(
-                        status_name, data_byte_count
-                    ),
-                )
-                if status_code == self.StatusCodes.Success:
-                    self._read_memory_response_event.set()
-            elif tag == self.ResponseTags.GetPropertyResponse:
-                # Make sure the response actually contain any property values
-                if parameter_count == 1:
-                    self.logger.log(
-                        level, "BlhostBase: ResponseTags.GetPropertyResponse: status: {}".format(status_name)
-                    )
-                else:
-                    # Unpack the property values and log them
-                    property_values = struct.Struct("<{}L".format(parameter_count - 1)).unpack(data[14:])
-                    if len(property_values) == 1:
-                        if (
-                            self.StatusCodes.AppCrcCheckPassed
-                            <= property_values[0]
-                            <= self.StatusCodes.AppCrcCheckOutOfRange
-                            or self.StatusCodes.ReliableUpdateSuccess
-                            <= property_values[0]
-                            <= self.StatusCodes.ReliableUpdateSwapIndicatorAddressInvalid
-                        ):
-                            try:
-                                property_values = self.StatusCodes(property_values[0]).name  # type: ignore
-                            except ValueError:
-                                property_values = property_values[0]
-                    self.logger.log(
-                        level,
-                        "BlhostBase: ResponseTags.GetPropertyResponse: status: {}, property value: {}".format(
-                            status_name, property_values
-                        ),
-                    )
-            # elif tag == self.ResponseTags.FlashReadOnceResponse:
-            #     pass
-            else:
-                self.logger.error("BlhostBase: Unhandled command tag: {}".format(tag))
-            self._get_command_response_event.set()
-        elif data[1] == self.FramingPacketConstants.Type_Data:
-            # Acknowledge that we received the response
-            self._ack()
-
-            # Store the incoming data. There is no reason to check the CRC, as it has already been checked in the parser
-            length = struct.Struct("<H").unpack(data[2:4])[0]
-            self._memory_data += bytes(struct.Struct("<{}B".format(length)).unpack(data[6:]))
-
-            # Indicate that we have read the data
-            self._data_event.set()
-        elif data[1] == self.FramingPacketConstants.Type_PingResponse:
-            self._ping_response_event.set()
-
-            protocol_bugfix, protocol_minor, protocol_major, protocol_name, options = struct.Struct("<BBBBH").unpack(
-                data[2:8]
-            )
-            protocol_version = "{}{}.{}.{}".format(chr(protocol_name), protocol_major, protocol_minor, protocol_bugfix)
-            self.logger.info("BlhostBase: Ping response: version: {}, options: {}".format(protocol_version, options))
-            if protocol_version not in ["P1.2.0", "P1.3.0"]:
-                self.logger.error("BlhostBase: Unsupported protocol version: {}".format(protocol_version))
+        handler = self._packet_handlers.get(data[1])
+        if handler is not None:
+            handler(data)
         else:
             self.logger.info("BlhostBase: Unhandled command type: {}".format(data[1]))
 
+    def _on_ack(self, data: bytearray) -> None:
+        # The previous packet was received successfully; the sending of more packets is allowed
+        self.logger.debug("BlhostBase: Received ACK")
+        self._ack_semaphore.release()
+
+    def _on_nak(self, data: bytearray) -> None:
+        # The previous packet was corrupted and must be re-sent
+        self.logger.warning("BlhostBase: Received NAK")
+        self._nak_event.set()
+        if not self._resend_on_nak:
+            # The last packet sent might not be the one that was NAKed, so wake up the upload, so it can fail instead
+            self._ack_semaphore.release()
+        elif len(self._last_send_packet) > 0:
+            self.logger.info("BlhostBase: Resending last packet")
+            self._send(self._last_send_packet)
+
+    def _on_ack_abort(self, data: bytearray) -> None:
+        # Data phase is being aborted
+        self.logger.error("BlhostBase: Received ACK abort")
+
+    def _on_command(self, data: bytearray) -> None:
+        # Acknowledge that we received the response
+        self._ack()
+
+        # length, crc16 = struct.Struct('<HH').unpack(data[2:6])
+        tag, flags, _, parameter_count = self._COMMAND_HEADER_STRUCT.unpack_from(data, 6)  # Parse the header
+
+        # Parse the status code and convert the status code into a user friendly name if possible
+        status_code = self._U32_STRUCT.unpack_from(data, 10)[0]
+        try:
+            status_name = self.StatusCodes(status_code).name
+        except ValueError:
+            status_name = str(status_code)
+
+        # Set the log level based on the status code
+        level = logging.INFO if status_code == self.StatusCodes.Success else logging.WARNING
+
+        handler = self._response_handlers.get(tag)
+        if handler is not None:
+            handler(data, parameter_count, status_code, status_name, level)
+        else:
+            self.logger.error("BlhostBase: Unhandled command tag: {}".format(tag))
+        self._get_command_response_event.set()
+
+    def _on_generic_response(
+        self, data: bytearray, parameter_count: int, status_code: int, status_name: str, level: int
+    ) -> None:
+        command_tag = self._U32_STRUCT.unpack_from(data, 14)[0]
+        # log the parameter value in a generic way
+        # to print KBOOT getProperty responses
+        self.logger.log(
+            level,
+            "BlhostBase: ResponseTags.GenericResponse: status: {}, parameter: {}".format(status_name, command_tag),
+        )
+
+        # Check which command tag the response was for
+        if command_tag == self.CommandTags.Reset:
+            self.logger.log(level, "BlhostBase: CommandTag.Reset status: {}".format(status_name))
+            if status_code == self.StatusCodes.Success:
+                self._reset_response_event.set()
+        elif command_tag == self.CommandTags.FlashEraseRegion:
+            self.logger.log(level, "BlhostBase: CommandTag.FlashEraseRegion status: {}".format(status_name))
+            if status_code == self.StatusCodes.Success:
+                self._flash_erase_region_response_event.set()
+        elif command_tag == self.CommandTags.ReadMemory:
+            self.logger.log(level, "BlhostBase: CommandTag.ReadMemory status: {}".format(status_name))
+            if status_code == self.StatusCodes.Success:
+                self._read_memory_response_tag_event.set()
+
+                # Wake up the reader, as no more data will be sent
+                self._data_event.set()
+        elif command_tag == self.CommandTags.WriteMemory:
+            self.logger.log(level, "BlhostBase: CommandTag.WriteMemory status: {}".format(status_name))
+            if status_code == self.StatusCodes.Success:
+                self._write_memory_response_event.set()
+        elif command_tag == self.CommandTags.ReliableUpdate:
+            if status_code == self.StatusCodes.ReliableUpdateSuccess:
+                level = logging.INFO  # Change the logging level, as this is also a successfully message
+            self.logger.log(level, "BlhostBase: CommandTag.ReliableUpdate status: {}".format(status_name))
+        else:
+            self.logger.log(
+                level,
+                "BlhostBase: ResponseTags.GenericResponse: status: {}, command tag: {:02X}".format(
+                    status_name, command_tag
+                ),
+            )
+
+    def _on_read_memory_response(
+        self, data: bytearray, parameter_count: int, status_code: int, status_name: str, level: int
+    ) -> None:
+        data_byte_count = self._U32_STRUCT.unpack_from(data, 14)[0]
+        self.logger.log(
+            level,
+            "BlhostBase: ResponseTags.ReadMemoryResponse: status: {}, data byte count: {}".format(
+                status_name, data_byte_count
+            ),
+        )
+        if status_code == self.StatusCodes.Success:
+            self._read_memory_response_event.set()
+
+    def _on_get_property_response(
+        self, data: bytearray, parameter_count: int, status_code: int, status_name: str, level: int
+    ) -> None:
+        # Make sure the response actually contain any property values
+        if parameter_count == 1:
+            self.logger.log(level, "BlhostBase: ResponseTags.GetPropertyResponse: status: {}".format(status_name))
+            return
+
+        # Unpack the property values and log them
+        with memoryview(data) as view:
+            property_values = tuple(
+                value for value, in self._U32_STRUCT.iter_unpack(view[14 : 14 + 4 * (parameter_count - 1)])
+            )
+        if status_code == self.StatusCodes.Success:
+            self._property_values = property_values
+        if len(property_values) == 1:
+            if (
+                self.StatusCodes.AppCrcCheckPassed <= property_values[0] <= self.StatusCodes.AppCrcCheckOutOfRange
+                or self.StatusCodes.ReliableUpdateSuccess
+                <= property_values[0]
+                <= self.StatusCodes.ReliableUpdateSwapIndicatorAddressInvalid
+            ):
+                try:
+                    property_values = self.StatusCodes(property_values[0]).name  # type: ignore
+                except ValueError:
+                    property_values = property_values[0]
+        self.logger.log(
+            level,
+            "BlhostBase: ResponseTags.GetPropertyResponse: status: {}, property value: {}".format(
+                status_name, property_values
+            ),
+        )
+
+    def _on_data(self, data: bytearray) -> None:
+        # Acknowledge that we received the response
+        self._ack()
+
+        # Store the incoming data. There is no reason to check the CRC, as it has already been checked in the parser
+        length = self._U16_STRUCT.unpack_from(data, 2)[0]
+        # A memoryview is used, so the payload is copied directly from the packet without creating a new object
+        offset = self._memory_data_offset
+        sink = self._memory_data_sink  # Only read it once, as it is cleared by read() in a different thread
+        with memoryview(data) as view:
+            if sink is not None:
+                sink.write(view[6 : 6 + length])
+            else:
+                self._memory_data[offset : offset + length] = view[6 : 6 + length]
+        self._memory_data_offset = offset + length
+
+        # Indicate that we have read the data
+        self._data_event.set()
+
+    def _on_ping_response(self, data: bytearray) -> None:
+        self._ping_response_event.set()
+
+        protocol_bugfix, protocol_minor, protocol_major, protocol_name, options = (
+            self._PING_RESPONSE_STRUCT.unpack_from(data, 2)
+        )
+        protocol_version = "{}{}.{}.{}".format(chr(protocol_name), protocol_major, protocol_minor, protocol_bugfix)
+        self.logger.info("BlhostBase: Ping response: version: {}, options: {}".format(protocol_version, options))
+        if protocol_version not in ["P1.2.0", "P1.3.0"]:
+            self.logger.error("BlhostBase: Unsupported protocol version: {}".format(protocol_version))
+
+
+# The framing packet constants as plain ints. These are used when building and parsing packets,
+# as looking up and comparing an IntEnum member is a lot slower than using a plain int
+_START_BYTE = int(BlhostBase.FramingPacketConstants.StartByte)
+_TYPE_ACK = int(BlhostBase.FramingPacketConstants.Type_Ack)
+_TYPE_NAK = int(BlhostBase.FramingPacketConstants.Type_Nak)
+_TYPE_ACK_ABORT = int(BlhostBase.FramingPacketConstants.Type_AckAbort)
+_TYPE_COMMAND = int(BlhostBase.FramingPacketConstants.Type_Command)
+_TYPE_DATA = int(BlhostBase.FramingPacketConstants.Type_Data)
+_TYPE_PING = int(BlhostBase.FramingPacketConstants.Type_Ping)
+_TYPE_PING_RESPONSE = int(BlhostBase.FramingPacketConstants.Type_PingResponse)
+
+# The ping and ACK packets never change, so they are only created once
+_PING_PACKET = bytes([_START_BYTE, _TYPE_PING])
+_ACK_PACKET = bytes([_START_BYTE, _TYPE_ACK])
+
 
 class BlhostDataParser(object):
     def __init__(self, logger: logging.Logger) -> None:
@@ -633,63 +827,79 @@ class BlhostDataParser(object):
         self._data_len = None  # type: Optional[int]
         self._data_crc = None  # type: Optional[int]
 
-    def parse(self, data: bytearray) -> Optional[bytearray]:
+    def feed(self, data: Union[bytes, bytearray]) -> Generator[bytearray, None, None]:
+        """Parse the data sent from the target.
+        Unlike parse() all the packets contained in the data are returned and not just the first one.
+        :param data: Data received from the target.
+        :return: Yields every packet that has been parsed.
+        """
+        packet = self.parse(data)
+        while True:
+            if packet is not None:
+                yield packet
+
+            # Keep parsing the buffered data until it does not contain any more packets
+            length = len(self._data)
+            packet = self.parse(b"")
+            if packet is None and len(self._data) == length:
+                return
+
+    def parse(self, data: Union[bytes, bytearray]) -> Optional[bytearray]:
         """Parse the data sent from the target.
         :param data: Data received from the target.
         :return: Returns the parsed data when the messages has been parsed.
         """
         # Append the incoming data to the buffer
+        # Note that the buffer is modified in place, as deleting from the front of a bytearray does not copy the rest
         self._data += data
 
-        # The packet type will always start with the start byte
-        while len(self._data) > 0 and self._data[0] != BlhostBase.FramingPacketConstants.StartByte:
-            self._logger.warning("BootloaderDataParser: Discarding invalid data: {}".format(self._data[0]))
-            self._data = self._data[1:]  # Discard the fist byte
+        # The packet type will always start with the start byte, so discard all the data before it
+        # The start byte is searched for using find(), so the data is not checked one byte at a time in Python
+        start = self._data.find(_START_BYTE)
+        if start == -1:
+            start = len(self._data)
+        if start > 0:
+            self._logger.warning("BootloaderDataParser: Discarding invalid data: {}".format(list(self._data[:start])))
+            del self._data[:start]
 
         if len(self._data) < 2:
             # We need more data before we can determine the type and what to do with it
             return None
 
-        if self._data[1] in [
-            BlhostBase.FramingPacketConstants.Type_Ack,
-            BlhostBase.FramingPacketConstants.Type_Nak,
-            BlhostBase.FramingPacketConstants.Type_AckAbort,
-        ]:
+        if self._data[1] in (_TYPE_ACK, _TYPE_NAK, _TYPE_ACK_ABORT):
             # Only return the first two bytes, as the next must be part of the next message
-            message, self._data = self._data[:2], self._data[2:]
+            message = self._data[:2]
+            del self._data[:2]
             return message
-        elif self._data[1] == BlhostBase.FramingPacketConstants.Type_Ping:
+        elif self._data[1] == _TYPE_PING:
             # Do not reply to ping commands, as only the host should be sending them,
             # so someone else must be trying to talk to the target
             self._logger.warning("BootloaderDataParser: Received ping command")
-            self._data = self._data[2:]  # Discard the fist two bytes
+            del self._data[:2]  # Discard the fist two bytes
             return None
-        elif self._data[1] == BlhostBase.FramingPacketConstants.Type_PingResponse:
+        elif self._data[1] == _TYPE_PING_RESPONSE:
             # The length is constant for the ping response
             self._data_len = 10
 
             # The CRC is stored in the last bytes
             if len(self._data) >= 10 and self._data_crc is None:
-                self._data_crc = self._data[8] | self._data[9] << 8
-        elif self._data[1] in [
-            BlhostBase.FramingPacketConstants.Type_Command,
-            BlhostBase.FramingPacketConstants.Type_Data,
-        ]:
+                self._data_crc = BlhostBase._U16_STRUCT.unpack_from(self._data, 8)[0]
+        elif self._data[1] in (_TYPE_COMMAND, _TYPE_DATA):
             if len(self._data) >= 4 and self._data_len is None:
                 # Store the total length of the data i.e. start byte (uint8_t), packet type (uint8_t),
                 # length (uint16_t), crc16 (uint16_t) and payload
-                self._data_len = 6 + (self._data[2] | self._data[3] << 8)
+                self._data_len = 6 + BlhostBase._U16_STRUCT.unpack_from(self._data, 2)[0]
 
             if len(self._data) >= 6 and self._data_crc is None:
-                self._data_crc = self._data[4] | self._data[5] << 8
+                self._data_crc = BlhostBase._U16_STRUCT.unpack_from(self._data, 4)[0]
         else:
             self._logger.error("BootloaderDataParser: Unknown command type: {}".format(self._data[1]))
-            self._data = self._data[2:]  # Discard the fist two bytes
+            del self._data[:2]  # Discard the fist two bytes
             return None
 
         # Check if we are done reading the packet
         if self._data_len is not None and len(self._data) >= self._data_len and self._data_crc is not None:
-            if self._data[1] == BlhostBase.FramingPacketConstants.Type_PingResponse:
+            if self._data[1] == _TYPE_PING_RESPONSE:
                 crc = BlhostBase.crc16_xmodem(self._data[:8])
             else:
                 crc = BlhostBase.crc16_xmodem(self._data[:4])
@@ -701,7 +911,8 @@ class BlhostDataParser(object):
                 )
 
             # Return the parsed message if the CRC matched; if not it will be discarded
-            message, self._data = self._data[: self._data_len], self._data[self._data_len :]
+            message = self._data[: self._data_len]
+            del self._data[: self._data_len]
             self._data_len = None
             self._data_crc = None
             if match:
@@ -723,18 +934,19 @@ class BlhostCanListener(can.Listener):
 
     def on_message_received(self, msg: can.Message) -> None:
         # We are only interested in frames from the target
+        # The ID is checked first, as it rejects most of the other frames on the bus. The rest of the checks are still
+        # needed, as a CAN-Bus provided by the user might not filter the frames
         if (
-            self._stopped
+            msg.arbitration_id != self._tx_id
+            or self._stopped
             or msg.is_error_frame
             or msg.is_remote_frame
             or msg.is_extended_id != self._extended_id
-            or msg.arbitration_id != self._tx_id
         ):
             return
 
-        # Parse the data and return it once it is fully parsed
-        data = self._parser.parse(msg.data)
-        if data is not None:
+        # Parse the data and return the packets once they are fully parsed
+        for data in self._parser.feed(msg.data):
             self._callback_func(data)
 
     def on_error(self, exc: Exception) -> None:
@@ -756,7 +968,7 @@ class BlhostCan(BlhostBase):
         channel: str = "can0",
         bitrate: int = 500000,
         can_bus: Optional[can.BusABC] = None,
-        time_to_sleep_between_messages: Optional[int] = None,
+        time_to_sleep_between_messages: Optional[float] = None,
         extended_id: bool = False,
     ) -> None:
         super(BlhostCan, self).__init__(logger)
@@ -799,13 +1011,25 @@ class BlhostCan(BlhostBase):
     def __enter__(self) -> "BlhostCan":
         return self
 
-    def _send_implementation(self, data: List[Any]) -> None:
+    def _send_implementation(self, data: Union[bytes, bytearray]) -> None:
         # Send out the message in chunks of 8 bytes on the CAN-Bus
+        if self._time_to_sleep_between_messages is None:
+            for d in BlhostBase.chunks(data, 8):
+                self._can_bus.send(can.Message(arbitration_id=self._rx_id, data=d, is_extended_id=self._extended_id))
+            return
+
+        # Space out the messages using deadlines, so the time spent sending a message counts towards the delay and the
+        # sleep is skipped entirely if sending took longer than the delay
+        deadline = time.monotonic()
         for d in BlhostBase.chunks(data, 8):
-            msg = can.Message(arbitration_id=self._rx_id, data=d, is_extended_id=self._extended_id)
-            self._can_bus.send(msg)
-            if self._time_to_sleep_between_messages is not None:
-                time.sleep(self._time_to_sleep_between_messages)
+            self._can_bus.send(can.Message(arbitration_id=self._rx_id, data=d, is_extended_id=self._extended_id))
+            deadline += self._time_to_sleep_between_messages
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                # Do not let the schedule fall behind, as that would send the next messages back-to-back
+                deadline -= remaining
 
     def shutdown(self, timeout: float = 1.0) -> None:
         self._can_notifier.stop(timeout=timeout)
@@ -814,11 +1038,25 @@ class BlhostCan(BlhostBase):
 
 
 class BlhostSerial(BlhostBase):
-    def __init__(self, port: str, baudrate: int, logger: logging.Logger) -> None:
+    def __init__(self, port: str, baudrate: int, logger: logging.Logger, low_latency: bool = False) -> None:
         super(BlhostSerial, self).__init__(logger)
 
         # Open the serial port, but read from it in a thread, so we are not blocking the main loop
-        self._serial = serial.Serial(port=port, baudrate=baudrate, timeout=0.5)
+        # The read blocks until data is received, as the read is cancelled when shutting down
+        self._serial = serial.Serial(port=port, baudrate=baudrate, timeout=None)
+        if sys.platform == "win32":
+            # The default driver buffers on Windows are only 4 KiB, so the data might be lost if the read thread is not
+            # scheduled in time. Note this is only supported on Windows
+            self._serial.set_buffer_size(rx_size=64 * 1024, tx_size=64 * 1024)
+
+        if low_latency:
+            # Ask the driver to pass on the received data immediately. For FTDI adapters this reduces the latency
+            # timer from 16 ms to 1 ms, which adds up as we wait for a response to every packet
+            try:
+                self._serial.set_low_latency_mode(True)
+            except (AttributeError, NotImplementedError, ValueError) as e:
+                # This is only supported on Linux and not by all drivers
+                self.logger.warning("BlhostSerial: Failed to enable low latency mode: {}".format(e))
         self._shutdown_thread = threading.Event()
         self._thread = threading.Thread(
             target=self._serial_read_thread,
@@ -831,11 +1069,13 @@ class BlhostSerial(BlhostBase):
     def __enter__(self) -> "BlhostSerial":
         return self
 
-    def _send_implementation(self, data: List[Any]) -> None:
+    def _send_implementation(self, data: Union[bytes, bytearray]) -> None:
         self._serial.write(data)
 
     def shutdown(self, timeout: float = 1.0) -> None:
         self._shutdown_thread.set()
+        # Wake up the read thread, so we do not have to wait for the read to time out
+        self._serial.cancel_read()
         self._thread.join(timeout=timeout)
         self._serial.close()
 
@@ -849,16 +1089,47 @@ class BlhostSerial(BlhostBase):
         try:
             parser = BlhostDataParser(logger)
             while not shutdown_event.is_set() and ser.is_open:
-                data = ser.read()
+                # Read all the data that is available, so the parser is not called for every single byte
+                data = ser.read(ser.in_waiting or 1)
                 if data:
-                    data = parser.parse(bytearray(data))
-                    if data is not None:
-                        callback_func(data)
+                    for packet in parser.feed(data):
+                        callback_func(packet)
         except Exception:
             logger.exception('BlhostSerial: Caught exception in "_serial_read_thread"')
 
 
-def cli() -> None:
+def create_logger(name: Optional[str] = None, level: int = logging.INFO) -> logging.Logger:
+    """Create a logger that prints all log output directly in the terminal.
+    If the logger already has a handler, no new handler is added, so calling this multiple times
+    will not print every message multiple times.
+    :param name: The name of the logger. The root logger is used if it is None.
+    :param level: The log level of the logger.
+    :return: Returns the logger.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not logger.handlers:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        logger.addHandler(stream_handler)
+    return logger
+
+
+def _auto_int(value: str) -> int:
+    """Convert a command line argument to an int. The base is determined by the prefix, so fx "0x" is hex.
+    :param value: The argument to convert.
+    :return: Returns the value as an int.
+    """
+    try:
+        return int(value, base=0)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid integer: {!r}".format(value))
+
+
+def _create_argument_parser() -> argparse.ArgumentParser:
+    """Create the parser used for the command line arguments.
+    :return: Returns the argument parser.
+    """
     parser = argparse.ArgumentParser(prog="pyblhost", add_help=False, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument(
         "hw_interface", help="Communicate with the target via either CAN or serial", choices=["can", "serial"]
@@ -877,8 +1148,8 @@ def cli() -> None:
 
     # Options for "can"
     required_can = parser.add_argument_group("required CAN arguments")
-    required_can.add_argument("-tx", "--tx-id", help="The TX ID to use for CAN")
-    required_can.add_argument("-rx", "--rx-id", help="The RX ID to use for CAN")
+    required_can.add_argument("-tx", "--tx-id", help="The TX ID to use for CAN", type=_auto_int)
+    required_can.add_argument("-rx", "--rx-id", help="The RX ID to use for CAN", type=_auto_int)
 
     optional_can = parser.add_argument_group("optional CAN arguments")
     optional_can.add_argument("-e", "--extended-id", help="CAN ID is an extended ID", type=int, default=0)
@@ -901,8 +1172,12 @@ def cli() -> None:
         version="%(prog)s {}".format(__version__),
     )
     optional.add_argument("-B", "--binary", help="The binary to upload or write memory into")
-    optional.add_argument("-s", "--start-address", help="The address to upload the binary at or read memory from")
-    optional.add_argument("-c", "--byte-count", dest="byte_count", help="The number of bytes to erase/read")
+    optional.add_argument(
+        "-s", "--start-address", help="The address to upload the binary at or read memory from", type=_auto_int
+    )
+    optional.add_argument(
+        "-c", "--byte-count", dest="byte_count", help="The number of bytes to erase/read", type=_auto_int
+    )
     optional.add_argument(
         "-t", "--timeout", help="The time to wait in seconds for a response (default 1.0)", default=1.0, type=float
     )
@@ -921,18 +1196,22 @@ def cli() -> None:
         type=int,
         default=500000,
     )
-    optional.add_argument("--prop", "--property", help="The property tag to get (default 0)", type=int, default=0)
+    optional.add_argument("--prop", "--property", help="The property tag to get (default 0)", type=_auto_int, default=0)
     optional.add_argument("--no-reset", help="Do not reset the target after upload", action="store_true")
     optional.add_argument("-v", "--verbose", help="Increase output verbosity", action="store_true")
     optional.add_argument("--assume-success", help="Assume success if uploading fails", action="store_true")
+    return parser
+
 
+def cli() -> None:
+    parser = _create_argument_parser()
     parsed_args = parser.parse_args()
     if parsed_args.hw_interface == "can":
         if parsed_args.tx_id is None or parsed_args.rx_id is None:
             parser.print_help()
-            exit(1)
+            sys.exit(1)
         BlHostImpl: Type[BlhostBase] = BlhostCan
-        args, kwargs = [int(parsed_args.tx_id, base=0), int(parsed_args.rx_id, base=0)], {
+        args, kwargs = [parsed_args.tx_id, parsed_args.rx_id], {
             "interface": parsed_args.interface,
             "channel": parsed_args.channel,
             "bitrate": parsed_args.baudrate,
@@ -941,32 +1220,29 @@ def cli() -> None:
     else:
         if parsed_args.port is None or parsed_args.baudrate is None:
             parser.print_help()
-            exit(1)
+            sys.exit(1)
         BlHostImpl = BlhostSerial
         args, kwargs = [parsed_args.port, parsed_args.baudrate], {}
 
+    # The formatter does not use the thread and process information, so there is no reason to store it in every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
     # Print all log output directly in the terminal
-    logger = logging.getLogger(__name__)
-    if parsed_args.verbose:
-        logger.setLevel(logging.DEBUG)
-    else:
-        logger.setLevel(logging.INFO)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(stream_handler)
-    kwargs["logger"] = logger
+    kwargs["logger"] = create_logger(__name__, logging.DEBUG if parsed_args.verbose else logging.INFO)
 
-    with BlHostImpl(*args, **kwargs) as blhost:  # type: ignore[arg-type]
+    with BlHostImpl(*args, **kwargs) as blhost:
         if parsed_args.command == "upload":
             if parsed_args.binary is None or parsed_args.start_address is None or parsed_args.byte_count is None:
                 parser.print_help()
-                exit(1)
+                sys.exit(1)
             pbar = None
             result = False
             for upload_progress in blhost.upload(
                 parsed_args.binary,
-                int(parsed_args.start_address, base=0),
-                int(parsed_args.byte_count, base=0),
+                parsed_args.start_address,
+                parsed_args.byte_count,
                 timeout=parsed_args.timeout,
                 ping_repeat=parsed_args.cmd_repeat,
                 reset=not parsed_args.no_reset,
@@ -991,19 +1267,19 @@ def cli() -> None:
                 pbar.close()  # Make sure it is closed
             if result is True:
                 blhost.logger.info("Uploading succeeded")
-                exit(0)
+                sys.exit(0)
             else:
                 blhost.logger.error("Uploading failed")
-                exit(1)
+                sys.exit(1)
         elif parsed_args.command == "read":
             if parsed_args.binary is None or parsed_args.start_address is None or parsed_args.byte_count is None:
                 parser.print_help()
-                exit(1)
+                sys.exit(1)
             pbar = None
             data = None
             for read_progress in blhost.read(
-                int(parsed_args.start_address, base=0),
-                int(parsed_args.byte_count, base=0),
+                parsed_args.start_address,
+                parsed_args.byte_count,
                 timeout=parsed_args.timeout,
                 ping_repeat=parsed_args.cmd_repeat,
             ):
@@ -1026,31 +1302,31 @@ def cli() -> None:
                 pbar.close()  # Make sure it is closed
             if data is None:
                 blhost.logger.error("Reading memory failed")
-                exit(1)
+                sys.exit(1)
             with open(parsed_args.binary, "wb") as f:
                 f.write(data)
             blhost.logger.info("Reading memory succeeded")
-            exit(0)
+            sys.exit(0)
         elif parsed_args.command == "ping":
             for i in range(parsed_args.cmd_repeat):
                 if blhost.ping(timeout=parsed_args.timeout):
                     blhost.logger.info("Ping responded in {} attempt(s)".format(i + 1))
-                    exit(0)
+                    sys.exit(0)
 
             blhost.logger.error("Timed out waiting for ping response")
-            exit(1)
+            sys.exit(1)
         elif parsed_args.command == "get_property":
             if not blhost.get_property(parsed_args.prop, timeout=parsed_args.timeout):
                 blhost.logger.error("Timed out waiting for property")
-                exit(1)
+                sys.exit(1)
         else:
             for i in range(parsed_args.cmd_repeat):
                 if blhost.reset(timeout=parsed_args.timeout):
                     blhost.logger.info("Reset responded in {} attempt(s)".format(i + 1))
-                    exit(0)
+                    sys.exit(0)
 
             blhost.logger.error("Timed out waiting for reset response")
-            exit(1)
+            sys.exit(1)
 
 
 if __name__ == "__main__":